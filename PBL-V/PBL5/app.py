@@ -1,9 +1,10 @@
 import streamlit as st
 from PIL import Image
 from datetime import datetime
+import io
 import os
-from PyPDF2 import PdfReader
-import docx2txt
+import fitz  # PyMuPDF
+from docx import Document
 
 # Case chat system (your existing module)
 from chat_system import (
@@ -11,11 +12,26 @@ from chat_system import (
     get_messages,
     add_message,
     create_chat_room,
-    get_response
+    get_response,
+    get_store_mtime
 )
 
 # Report Q&A system (Gemini + offline)
-from report_qa_chat import ReportQASystem
+from report_qa_chat import get_qa_system
+
+PREVIEW_CHARS = 5000
+
+
+# -----------------------------
+# Report Text Extraction
+# -----------------------------
+def iter_pdf_pages(file):
+    """Yield the text of each PDF page lazily."""
+    doc = fitz.open(stream=file.read(), filetype="pdf")
+    try:
+        yield from (page.get_text("text") for page in doc)
+    finally:
+        doc.close()
 
 
 # -----------------------------
@@ -58,12 +74,20 @@ elif page == "💬 Case Chat":
     if uploaded_file:
         st.image(Image.open(uploaded_file), use_column_width=True)
 
-    rooms = get_available_rooms()
-    if rooms:
-        room_map = {
+    # Rebuild the room picker only when the chat store changes on disk
+    store_mtime = get_store_mtime()
+    if (
+        "rooms_cache" not in st.session_state
+        or st.session_state.get("rooms_mtime") != store_mtime
+    ):
+        st.session_state.rooms_cache = {
             f"{r['id']} – {r['description']}": r["id"]
-            for r in rooms
+            for r in get_available_rooms()
         }
+        st.session_state.rooms_mtime = store_mtime
+
+    room_map = st.session_state.rooms_cache
+    if room_map:
         selected = st.selectbox("Join Case", room_map.keys())
         if st.button("Join"):
             st.session_state.case_id = room_map[selected]
@@ -110,15 +134,9 @@ elif page == "📄 Report Q&A":
         type="password"
     )
 
-    # Initialize / reinitialize QA system only if key changes
-    if (
-        "qa_system" not in st.session_state
-        or st.session_state.get("current_gemini_key") != gemini_key
-    ):
-        st.session_state.qa_system = ReportQASystem(
-            gemini_api_key=gemini_key if gemini_key else None
-        )
-        st.session_state.current_gemini_key = gemini_key
+    # One shared QA system per key, kept across reruns by st.cache_resource
+    gemini_key = (gemini_key or "").strip()
+    st.session_state.qa_system = get_qa_system(gemini_key or None)
 
     if gemini_key:
         st.success("✅ Gemini AI Enabled")
@@ -140,10 +158,12 @@ elif page == "📄 Report Q&A":
         report_content = ""
 
         if uploaded_report.type == "application/pdf":
-            reader = PdfReader(uploaded_report)
-            report_content = "\n".join(
-                [page.extract_text() or "" for page in reader.pages]
-            )
+            buf = io.StringIO()
+            for i, page_text in enumerate(iter_pdf_pages(uploaded_report)):
+                if i:
+                    buf.write("\n")
+                buf.write(page_text)
+            report_content = buf.getvalue()
 
         elif uploaded_report.type == "text/plain":
             report_content = uploaded_report.read().decode(
@@ -154,19 +174,24 @@ elif page == "📄 Report Q&A":
             "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             "application/msword"
         ):
-            temp_path = f"temp_{uploaded_report.name}"
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_report.read())
-
-            report_content = docx2txt.process(temp_path)
-            os.remove(temp_path)
+            doc = Document(io.BytesIO(uploaded_report.getvalue()))
+            lines = [p.text for p in doc.paragraphs]
+            # Lab values are often laid out in tables
+            for table in doc.tables:
+                for row in table.rows:
+                    lines.append(" ".join(cell.text for cell in row.cells))
+            report_content = "\n".join(lines)
 
         st.success(f"Report **{uploaded_report.name}** uploaded successfully ✅")
 
+        preview = report_content
+        if len(preview) > PREVIEW_CHARS:
+            preview = preview[:PREVIEW_CHARS] + "…"
+
         with st.expander("📄 Report Preview"):
             st.text_area(
                 "Extracted Report Text",
-                report_content,
+                preview,
                 height=250
             )
 
@@ -189,11 +214,8 @@ elif page == "📄 Report Q&A":
     st.subheader("💬 Ask Questions About Reports")
 
     if question := st.chat_input("Ask a question based on the uploaded reports"):
-        with st.spinner("Thinking..."):
-            answer = st.session_state.qa_system.answer_question(question)
-
         with st.chat_message("user"):
             st.write(question)
 
         with st.chat_message("assistant"):
-            st.write(answer)
+            st.write_stream(st.session_state.qa_system.answer_question(question))
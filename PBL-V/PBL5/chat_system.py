@@ -1,69 +1,130 @@
 # chat_system_medical_api.py
-import json
+import asyncio
 import os
 import uuid
-import time
+import sqlite3
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import zstandard as zstd
 
 # ============================================================
 # STORAGE
 # ============================================================
-STORE_PATH = "chat_store.json"
-CACHE_FILE = "api_cache.json"
+STORE_PATH = "chat_store.json"  # legacy plain JSON, read if no .zst exists
+COMPRESSED_STORE_PATH = STORE_PATH + ".zst"
+CACHE_FILE = "api_cache.json"  # legacy JSON cache, imported into CACHE_DB
+# Messages live in one append-only NDJSON file per room
+MESSAGES_DIR = "chat_messages"
+MESSAGES_PATH = os.path.join(MESSAGES_DIR, "{}.ndjson")
+
+# In-memory copy of the store, reused until the file's mtime changes
+_STORE_CACHE = None
+_STORE_MTIME = -1
+
+def _active_store_path():
+    if os.path.exists(COMPRESSED_STORE_PATH):
+        return COMPRESSED_STORE_PATH
+    return STORE_PATH
+
+def get_store_mtime():
+    """Modification stamp of the store file, or None if it doesn't exist yet."""
+    try:
+        return os.stat(_active_store_path()).st_mtime_ns
+    except OSError:
+        return None
 
 def get_chat_store():
-    if os.path.exists(STORE_PATH):
-        try:
-            with open(STORE_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {"rooms": {}}
+    global _STORE_CACHE, _STORE_MTIME
+    path = _active_store_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {"rooms": {}}
+
+    if _STORE_CACHE is not None and mtime == _STORE_MTIME:
+        return _STORE_CACHE
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if path == COMPRESSED_STORE_PATH:
+            data = zstd.ZstdDecompressor().decompress(data)
+        store = orjson.loads(data)
+    except Exception:
+        return {"rooms": {}}
+
+    _STORE_CACHE, _STORE_MTIME = store, mtime
+    return store
 
 def save_chat_store(store):
-    with open(STORE_PATH, "w", encoding="utf-8") as f:
-        json.dump(store, f, indent=2)
+    global _STORE_CACHE, _STORE_MTIME
+    data = zstd.ZstdCompressor(level=1).compress(orjson.dumps(store))
+    with open(COMPRESSED_STORE_PATH, "wb") as f:
+        f.write(data)
+    _STORE_CACHE = store
+    _STORE_MTIME = os.stat(COMPRESSED_STORE_PATH).st_mtime_ns
+
+def _append_message(case_id, message):
+    os.makedirs(MESSAGES_DIR, exist_ok=True)
+    with open(MESSAGES_PATH.format(case_id), "ab") as f:
+        f.write(orjson.dumps(message) + b"\n")
+
+def _read_messages(case_id):
+    path = MESSAGES_PATH.format(case_id)
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        return [orjson.loads(line) for line in f if line.strip()]
 
 # ============================================================
 # CHAT ROOMS
 # ============================================================
+WELCOME_TEMPLATE = "👋 Welcome to '{}'. I am Dr. AI — your medical assistant."
+
 def create_chat_room(case_id=None, creator_name="Unknown", case_description="General Case"):
     store = get_chat_store()
     case_id = case_id or str(uuid.uuid4())
     if case_id not in store["rooms"]:
+        now_iso = datetime.now().isoformat()
         store["rooms"][case_id] = {
             "id": case_id,
             "creator": creator_name,
             "description": case_description,
-            "created_at": datetime.now().isoformat(),
-            "participants": [creator_name, "Dr. AI Assistant"],
-            "messages": [
-                {
-                    "id": str(uuid.uuid4()),
-                    "user": "Dr. AI Assistant",
-                    "content": f"👋 Welcome to '{case_description}'. I am Dr. AI — your medical assistant.",
-                    "timestamp": datetime.now().isoformat()
-                }
-            ]
+            "created_at": now_iso,
+            "participants": [creator_name, "Dr. AI Assistant"]
         }
         save_chat_store(store)
+        _append_message(case_id, {
+            "id": str(uuid.uuid4()),
+            "user": "Dr. AI Assistant",
+            "content": WELCOME_TEMPLATE.format(case_description),
+            "timestamp": now_iso
+        })
     return case_id
 
 def add_message(case_id, user, content):
     store = get_chat_store()
     if case_id in store["rooms"]:
-        store["rooms"][case_id]["messages"].append({
+        _append_message(case_id, {
             "id": str(uuid.uuid4()),
             "user": user,
             "content": content,
             "timestamp": datetime.now().isoformat()
         })
-        save_chat_store(store)
 
 def get_messages(case_id):
     store = get_chat_store()
-    return store["rooms"].get(case_id, {}).get("messages", [])
+    room = store["rooms"].get(case_id)
+    if room is None:
+        return []
+    # Rooms created before the NDJSON layout still carry inline messages
+    return room.get("messages", []) + _read_messages(case_id)
 
 def get_available_rooms():
     store = get_chat_store()
@@ -79,84 +140,105 @@ if not RAPIDAPI_KEY:
 RAPIDAPI_HOST = "ai-doctor-api-ai-medical-chatbot-healthcare-ai-assistant.p.rapidapi.com"
 BASE_URL = f"https://{RAPIDAPI_HOST}/chat?noqueue=1"
 
+HEADERS = {
+    "Content-Type": "application/json",
+    "X-RapidAPI-Key": RAPIDAPI_KEY,
+    "X-RapidAPI-Host": RAPIDAPI_HOST
+}
+
+# Retry policy shared by the sync session and the async batch path
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# One pooled session so retries and later calls reuse the TLS connection
+_session = requests.Session()
+_session.headers.update(HEADERS)
+_adapter = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=10,
+    max_retries=Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None  # the chat endpoint is POST-only
+    )
+)
+_session.mount("https://", _adapter)
+
 # ============================================================
 # CACHE
 # ============================================================
+# Key-value cache in SQLite so lookups and inserts don't touch other entries
+CACHE_DB = "api_cache.db"
+
+_conn = sqlite3.connect(CACHE_DB, check_same_thread=False)
+_conn.execute("PRAGMA journal_mode=WAL")
+_conn.execute("CREATE TABLE IF NOT EXISTS cache(k TEXT PRIMARY KEY, v BLOB)")
+
+def _import_legacy_cache():
+    """Copy entries from the old api_cache.json into an empty cache table."""
+    if not os.path.exists(CACHE_FILE):
+        return
+    if _conn.execute("SELECT 1 FROM cache LIMIT 1").fetchone():
+        return
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            legacy = orjson.loads(f.read())
+    except Exception:
+        return
+    _conn.executemany(
+        "INSERT OR IGNORE INTO cache VALUES (?, ?)",
+        ((k, orjson.dumps(v)) for k, v in legacy.items())
+    )
+    _conn.commit()
+
+_import_legacy_cache()
+
 def get_cached_response(query):
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                return json.load(f).get(query.lower())
-        except Exception:
-            return None
-    return None
+    try:
+        row = _conn.execute("SELECT v FROM cache WHERE k=?", (query.lower(),)).fetchone()
+    except sqlite3.Error:
+        return None
+    return orjson.loads(row[0]) if row else None
 
 def save_cached_response(query, response):
-    cache = {}
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                cache = json.load(f)
-        except Exception:
-            cache = {}
-    cache[query.lower()] = response
-    with open(CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(cache, f, indent=2)
+    _conn.execute(
+        "INSERT OR REPLACE INTO cache VALUES (?, ?)",
+        (query.lower(), orjson.dumps(response))
+    )
+    _conn.commit()
 
 # ============================================================
 # FETCH MEDICAL INFO FROM NEW API
 # ============================================================
-def fetch_medical_info(query: str) -> dict:
-    query_lower = query.lower()
-
-    # 1️⃣ Check cache
-    cached = get_cached_response(query_lower)
-    if cached:
-        return cached
-
-    payload = {
+def _build_payload(query: str) -> dict:
+    return {
         "message": query,
         "specialization": "general",
         "language": "en"
     }
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-RapidAPI-Key": RAPIDAPI_KEY,
-        "X-RapidAPI-Host": RAPIDAPI_HOST
-    }
+def _parse_response(query: str, data: dict) -> dict:
+    # ✅ Extract fields from structured response
+    resp_obj = data.get("result", {}).get("response", {})
 
-    for attempt in range(3):
-        try:
-            response = requests.post(BASE_URL, json=payload, headers=headers, timeout=15)
-            response.raise_for_status()
-            data = response.json()
-
-            # ✅ Extract fields from structured response
-            resp_obj = data.get("result", {}).get("response", {})
-
-            description = resp_obj.get("message", "Not available")
-            recommendations = resp_obj.get("recommendations", [])
-            warnings = resp_obj.get("warnings", [])
-            references = resp_obj.get("references", [])
-            follow_up = resp_obj.get("followUp", [])
-
-            result = {
-                "query": query,
-                "description": description,
-                "common_symptoms": "; ".join(recommendations) if recommendations else "Not available",
-                "treatment": "; ".join(follow_up) if follow_up else "Not available",
-                "warnings": "; ".join(warnings) if warnings else "None",
-                "references": "; ".join(references) if references else "None"
-            }
-
-            save_cached_response(query_lower, result)
-            return result
+    description = resp_obj.get("message", "Not available")
+    recommendations = resp_obj.get("recommendations", [])
+    warnings = resp_obj.get("warnings", [])
+    references = resp_obj.get("references", [])
+    follow_up = resp_obj.get("followUp", [])
 
-        except Exception as e:
-            print(f"Warning: Attempt {attempt + 1} failed: {e}")
-            time.sleep(2)
+    return {
+        "query": query,
+        "description": description,
+        "common_symptoms": "; ".join(recommendations) if recommendations else "Not available",
+        "treatment": "; ".join(follow_up) if follow_up else "Not available",
+        "warnings": "; ".join(warnings) if warnings else "None",
+        "references": "; ".join(references) if references else "None"
+    }
 
+def _unavailable(query: str) -> dict:
     # ❌ API completely failed
     return {
         "query": query,
@@ -167,6 +249,101 @@ def fetch_medical_info(query: str) -> dict:
         "references": "Unavailable"
     }
 
+def _fetch_medical_info_uncached(query: str) -> dict:
+    """Look up a query in the disk cache, falling back to the API.
+
+    Raises RuntimeError if the API request fails after retries.
+    """
+    # 1️⃣ Check cache
+    cached = get_cached_response(query)
+    if cached:
+        return cached
+
+    try:
+        # Retries with backoff are handled by the session's adapter
+        response = _session.post(BASE_URL, json=_build_payload(query), timeout=15)
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        print(f"Warning: Medical API request failed: {e}")
+        raise RuntimeError(f"Medical service unavailable for {query!r}") from e
+
+    result = _parse_response(query, data)
+    save_cached_response(query, result)
+    return result
+
+# In-process LRU above the disk cache, shared by the sync and async paths.
+# Only successful results are stored, so failures are retried next time.
+MEMO_SIZE = 512
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+def _memo_get(query_lower: str):
+    with _memo_lock:
+        result = _memo.get(query_lower)
+        if result is not None:
+            _memo.move_to_end(query_lower)
+        return result
+
+def _memo_put(query_lower: str, result: dict):
+    with _memo_lock:
+        _memo[query_lower] = result
+        _memo.move_to_end(query_lower)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+def fetch_medical_info(query: str) -> dict:
+    query_lower = query.lower()
+    result = _memo_get(query_lower)
+    if result is None:
+        try:
+            result = _fetch_medical_info_uncached(query_lower)
+        except RuntimeError:
+            return _unavailable(query)
+        _memo_put(query_lower, result)
+    return {**result, "query": query}
+
+# ============================================================
+# CONCURRENT FETCH (batch paths)
+# ============================================================
+async def _apost_with_retry(client: httpx.AsyncClient, payload: dict) -> dict:
+    """POST with the same retry/backoff policy as the sync session."""
+    for attempt in range(RETRY_TOTAL + 1):
+        last_try = attempt == RETRY_TOTAL
+        try:
+            response = await client.post(BASE_URL, json=payload, headers=HEADERS)
+        except httpx.TransportError:
+            if last_try:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or last_try:
+                response.raise_for_status()
+                return response.json()
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+async def afetch_medical_info(client: httpx.AsyncClient, query: str) -> dict:
+    query_lower = query.lower()
+
+    result = _memo_get(query_lower) or get_cached_response(query_lower)
+    if result is None:
+        try:
+            data = await _apost_with_retry(client, _build_payload(query_lower))
+        except Exception as e:
+            print(f"Warning: Medical API request failed: {e}")
+            return _unavailable(query)
+        result = _parse_response(query_lower, data)
+        save_cached_response(query_lower, result)
+    _memo_put(query_lower, result)
+    return {**result, "query": query}
+
+async def _gather(queries):
+    async with httpx.AsyncClient(timeout=15) as client:
+        return await asyncio.gather(*[afetch_medical_info(client, q) for q in queries])
+
+def fetch_many(queries) -> list:
+    """Fetch several queries concurrently; results keep the input order."""
+    return asyncio.run(_gather(queries))
+
 # ============================================================
 # RESPONSE
 # ============================================================
@@ -4,12 +4,15 @@ import re
 import json
 import uuid
 import base64
+import shutil
+import threading
 import pydicom
 import nibabel as nib
 import numpy as np
 import cv2
 from PIL import Image
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from Bio import Entrez
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
@@ -33,17 +36,20 @@ def process_file(uploaded_file):
     elif ext == 'dcm':
         dicom = pydicom.dcmread(uploaded_file)
         img_array = dicom.pixel_array
-        img_array = ((img_array - img_array.min()) / (img_array.max() - img_array.min()) * 255).astype(np.uint8)
+        img_array = cv2.normalize(img_array, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
         return {"type": "dicom", "data": Image.fromarray(img_array), "array": img_array}
 
     elif ext in ['nii', 'nii.gz']:
         temp_path = f"temp_{uuid.uuid4()}.nii.gz"
+        uploaded_file.seek(0)
         with open(temp_path, 'wb') as f:
-            f.write(uploaded_file.getvalue())
+            shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
 
         nii_img = nib.load(temp_path)
-        img_array = nii_img.get_fdata()[:, :, nii_img.shape[2] // 2]
-        img_array = ((img_array - img_array.min()) / (img_array.max() - img_array.min()) * 255).astype(np.uint8)
+        # Read only the middle slice through the proxy, not the whole volume
+        k = nii_img.shape[2] // 2
+        img_array = np.asarray(nii_img.dataobj[:, :, k], dtype=np.float32)
+        img_array = cv2.normalize(img_array, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
         os.remove(temp_path)
         return {"type": "nifti", "data": Image.fromarray(img_array), "array": img_array}
 
@@ -52,24 +58,43 @@ def process_file(uploaded_file):
 # ---------------------------
 # Heatmap Generation
 # ---------------------------
+# Per-thread overlay buffer reused while the image shape stays the same
+_heatmap_local = threading.local()
+
+def _overlay_buffer(shape, dtype):
+    buf = getattr(_heatmap_local, "buf", None)
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = np.empty(shape, dtype=dtype)
+        _heatmap_local.buf = buf
+    return buf
+
 def generate_heatmap(image_array):
     """Generate heatmap overlay for visualization"""
-    if len(image_array.shape) == 3:
+    if image_array.ndim == 3:
         gray_image = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+        rgb_image = image_array
     else:
         gray_image = image_array
+        rgb_image = cv2.cvtColor(image_array, cv2.COLOR_GRAY2RGB)
 
     heatmap = cv2.applyColorMap(gray_image, cv2.COLORMAP_JET)
 
-    if len(image_array.shape) == 2:
-        image_array = cv2.cvtColor(image_array, cv2.COLOR_GRAY2RGB)
-
-    overlay = cv2.addWeighted(heatmap, 0.5, image_array, 0.5, 0)
+    overlay = cv2.addWeighted(heatmap, 0.5, rgb_image, 0.5, 0,
+                              dst=_overlay_buffer(heatmap.shape, heatmap.dtype))
+    # Image.fromarray copies RGB data, so the buffer is safe to reuse
     return Image.fromarray(overlay), Image.fromarray(heatmap)
 
 # ---------------------------
 # Extract Findings & Keywords
 # ---------------------------
+KEYWORD_STOPWORDS = frozenset({"about", "with", "that", "this", "these"})
+COMMON_TERMS = (
+    "pneumonia", "infiltrates", "opacities", "nodule", "mass", "tumor", "cardiomegaly",
+    "effusion", "consolidation", "atelectasis", "edema", "fracture", "fibrosis", "emphysema",
+    "pneumothorax", "metastasis"
+)
+_COMMON_TERMS_RE = re.compile("|".join(COMMON_TERMS), re.IGNORECASE)
+
 def extract_findings_and_keywords(analysis_text):
     """Extract findings and keywords from analysis text"""
     findings = []
@@ -91,17 +116,12 @@ def extract_findings_and_keywords(analysis_text):
 
                 for word in clean_item.split():
                     word = word.lower().strip(',.:;()')
-                    if len(word) > 4 and word not in ['about', 'with', 'that', 'this', 'these']:
+                    if len(word) > 4 and word not in KEYWORD_STOPWORDS:
                         keywords.append(word)
 
-    common_terms = [
-        "pneumonia", "infiltrates", "opacities", "nodule", "mass", "tumor", "cardiomegaly",
-        "effusion", "consolidation", "atelectasis", "edema", "fracture", "fibrosis", "emphysema",
-        "pneumothorax", "metastasis"
-    ]
-    for term in common_terms:
-        if term in analysis_text.lower() and term not in keywords:
-            keywords.append(term)
+    # One regex scan instead of lowercasing the whole text per term
+    found = {m.lower() for m in _COMMON_TERMS_RE.findall(analysis_text)}
+    keywords.extend(term for term in COMMON_TERMS if term in found)
 
     keywords = list(dict.fromkeys(keywords))
     return findings, keywords[:5]
@@ -155,6 +175,21 @@ def analyze_image(image, api_key, enable_xai=True):
 # ---------------------------
 # PubMed Search
 # ---------------------------
+_MEDLINE_LINE_RE = re.compile(r"^(PMID|TI|TA|DP)\s*-\s*(.*)$")
+_YEAR_RE = re.compile(r"\b\d{4}\b")
+_MEDLINE_FIELDS = {"PMID": "id", "TI": "title", "TA": "journal", "DP": "year"}
+
+def _fetch_medline(query, max_results):
+    """Run esearch + efetch for a query and return the MEDLINE text"""
+    handle = Entrez.esearch(db="pubmed", term=query, retmax=max_results)
+    results = Entrez.read(handle)
+
+    if not results["IdList"]:
+        return ""
+
+    fetch_handle = Entrez.efetch(db="pubmed", id=results["IdList"], rettype="medline", retmode="text")
+    return fetch_handle.read()
+
 def search_pubmed(keywords, max_results=5):
     """Search PubMed for relevant articles"""
     if not keywords:
@@ -162,14 +197,7 @@ def search_pubmed(keywords, max_results=5):
 
     query = ' AND '.join(keywords)
     try:
-        handle = Entrez.esearch(db="pubmed", term=query, retmax=max_results)
-        results = Entrez.read(handle)
-
-        if not results["IdList"]:
-            return []
-
-        fetch_handle = Entrez.efetch(db="pubmed", id=results["IdList"], rettype="medline", retmode="text")
-        records = fetch_handle.read().split('\n\n')
+        records = _fetch_medline(query, max_results).split('\n\n')
 
         publications = []
         for record in records:
@@ -178,15 +206,14 @@ def search_pubmed(keywords, max_results=5):
 
             pub_data = {"id": "", "title": "", "journal": "", "year": ""}
             for line in record.split('\n'):
-                if line.startswith('PMID-'):
-                    pub_data["id"] = line[6:].strip()
-                elif line.startswith('TI  -'):
-                    pub_data["title"] = line[6:].strip()
-                elif line.startswith('TA  -'):
-                    pub_data["journal"] = line[6:].strip()
-                elif line.startswith('DP  -'):
-                    year_match = re.findall(r"\b\d{4}\b", line)
-                    pub_data["year"] = year_match[0] if year_match else "2024"
+                match = _MEDLINE_LINE_RE.match(line)
+                if not match:
+                    continue
+                tag, value = match.groups()
+                if tag == "DP":
+                    year_match = _YEAR_RE.search(value)
+                    value = year_match.group() if year_match else "2024"
+                pub_data[_MEDLINE_FIELDS[tag]] = value.strip()
 
             if pub_data["id"]:
                 publications.append(pub_data)
@@ -197,6 +224,12 @@ def search_pubmed(keywords, max_results=5):
         print(f"Error searching PubMed: {e}")
         return []
 
+def search_pubmed_many(keyword_batches, max_results=5):
+    """Search PubMed for several keyword sets concurrently"""
+    # NCBI allows 3 requests/second without an API key
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        return list(executor.map(lambda kw: search_pubmed(kw, max_results), keyword_batches))
+
 # ---------------------------
 # PDF Report Generation
 # ---------------------------
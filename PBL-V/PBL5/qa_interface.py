@@ -1,7 +1,7 @@
-import json
-import os
+import time
 from datetime import datetime
-import google.generativeai as genai
+
+from report_store import get_store
 
 
 class ReportQASystem:
@@ -10,25 +10,19 @@ class ReportQASystem:
     """
     def __init__(self, gemini_api_key=None):
         self.gemini_api_key = gemini_api_key
-        self.analysis_store = self._load_store()
+        # Shared with report_qa_chat so both read and write one copy
+        self.store = get_store()
+        self.analysis_store = self.store.data
 
-    # -------------------------
-    # Storage Management
-    # -------------------------
-    def _load_store(self):
-        """Load existing analysis data from file or create new."""
-        if os.path.exists("analysis_store.json"):
-            try:
-                with open("analysis_store.json", "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                return {"analyses": []}
-        return {"analyses": []}
-
-    def _save_store(self):
-        """Save current analyses to file."""
-        with open("analysis_store.json", "w", encoding="utf-8") as f:
-            json.dump(self.analysis_store, f, indent=2)
+        self.model = None
+        if gemini_api_key:
+            # Deferred so offline use doesn't pay for the SDK import
+            import google.generativeai as genai
+            genai.configure(api_key=gemini_api_key)
+            self.model = genai.GenerativeModel(
+                "gemini-1.5-flash",
+                generation_config={"response_mime_type": "text/plain"}
+            )
 
     # -------------------------
     # Add / Manage Reports
@@ -41,8 +35,8 @@ class ReportQASystem:
             "date": datetime.now().isoformat(),
             "findings": [],
         }
-        self.analysis_store["analyses"].append(entry)
-        self._save_store()
+        self.store.add(entry)
+        self.store.flush()
 
     # -------------------------
     # Q&A Processing
@@ -64,14 +58,11 @@ class ReportQASystem:
         )
 
         # Handle both test (no API key) and live Gemini use
-        if not self.gemini_api_key:
+        if not self.model:
             return f"(Simulated answer) You asked: '{question}'. I would analyze the reports to provide insights."
 
         try:
-            genai.configure(api_key=self.gemini_api_key)
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            response = model.generate_content(prompt)
-            return response.text.strip()
+            return self.model.generate_content(prompt).text
         except Exception as e:
             return f"⚠️ Gemini Error: {e}"
 
@@ -91,9 +82,14 @@ class ReportQAChat:
         self.chat_history.append({
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": time.time()
         })
 
+    @staticmethod
+    def timestamp_iso(message):
+        """Format a message's epoch timestamp for display."""
+        return datetime.fromtimestamp(message["timestamp"]).isoformat()
+
     def get_history(self):
         """Return the full chat conversation."""
         return self.chat_history
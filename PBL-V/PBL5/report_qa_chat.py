@@ -1,11 +1,33 @@
-import json
-import os
+import hashlib
 import uuid
 import re
-from datetime import datetime
+import time
+import threading
+from collections import OrderedDict
 
 import streamlit as st
-import google.generativeai as genai
+
+from report_store import OFFLINE_MODEL, get_store
+
+MODEL_NAME = "gemini-2.5-flash"
+# Parsed value statuses, usable directly as bucket indexes
+STATUS_NORMAL, STATUS_HIGH, STATUS_LOW = 0, 1, 2
+_STATUS_CODES = {"NORMAL": STATUS_NORMAL, "HIGH": STATUS_HIGH, "LOW": STATUS_LOW}
+_STATUS_ARROWS = ("", " ↑", " ↓")
+
+# Reports sent to Gemini per question once the store grows past this
+TOP_K_REPORTS = 5
+
+# "PARAM: 12.3 HIGH" / "PARAM 12.3" lines, optionally behind a "-", "*", "•"
+# or "1." list marker; case-insensitive so the text needs no upcasing. Every
+# name word starts with a letter, so a bare number is never swallowed into
+# the name, and no part crosses a newline so one finditer covers the report.
+_REPORT_VALUE_RE = re.compile(
+    r"^[ \t]*(?:[-*•]|\d+[.)])?[ \t]*([A-Z][A-Z0-9]*(?: +[A-Z][A-Z0-9]*){0,5})"
+    r"(?:[ \t]*[:\-][ \t]*|[ \t]+(?=\d))"
+    r"(\d+(?:\.\d+)?)[ \t]*(HIGH|LOW|NORMAL)?",
+    re.IGNORECASE | re.MULTILINE
+)
 
 
 class ReportQASystem:
@@ -13,95 +35,98 @@ class ReportQASystem:
     Medical report Q&A system using Gemini (google-generativeai SDK)
     """
 
+    # Gemini answers shared across instances: key -> (timestamp, answer)
+    RESPONSE_TTL = 3600
+    RESPONSE_CACHE_SIZE = 500
+    _response_cache = OrderedDict()
+    _response_lock = threading.Lock()
+
     def __init__(self, gemini_api_key=None):
-        self.analysis_store = self._load_analysis_store()
+        # Shared with every other Q&A system in the process
+        self.store = get_store()
+        self.analysis_store = self.store.data
+
+        # Caches derived from the report list, keyed by store.version
+        self._combined_cache = (-1, "")
+        # TF-IDF index over report texts, rebuilt lazily on version change
+        # (store version, vectorizer, doc matrix, report texts), replaced as a
+        # whole so concurrent sessions never see a half-built index
+        self._tfidf_index = (-1, None, None, ())
 
         # ✅ Streamlit secrets (Option 1)
         api_key = gemini_api_key or st.secrets.get("GOOGLE_API_KEY")
         self.model = None
 
         if api_key:
+            # Imported here: the SDK pulls in grpc/protobuf, which offline
+            # mode never needs, so keep it off the cold-start path
+            import google.generativeai as genai
             genai.configure(api_key=api_key)
             # ✅ Free-tier safe model
-            self.model = genai.GenerativeModel("gemini-2.5-flash")
+            self.model = genai.GenerativeModel(MODEL_NAME)
         else:
             print("⚠️ Gemini API key not found. Running in offline mode.")
 
     # -----------------------------
     # Storage
     # -----------------------------
-    def _load_analysis_store(self):
-        if os.path.exists("analysis_store.json"):
-            try:
-                with open("analysis_store.json", "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                pass
-        return {"analyses": []}
-
-    def _save_store(self):
-        with open("analysis_store.json", "w", encoding="utf-8") as f:
-            json.dump(self.analysis_store, f, indent=2, ensure_ascii=False)
+    def flush(self):
+        """Persist pending changes to the shared store."""
+        self.store.flush()
 
     # -----------------------------
     # Upload report
     # -----------------------------
-    def upload_report(self, filename, content):
+    @staticmethod
+    def _content_hash(content):
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def upload_report(self, filename, content, content_hash=None):
         report_id = str(uuid.uuid4())
-        self.analysis_store["analyses"].append({
+        entry = {
             "id": report_id,
             "filename": filename,
             "analysis": content,
-            "uploaded_at": datetime.now().isoformat(),
+            "content_hash": content_hash or self._content_hash(content),
+            "uploaded_at": time.time(),
             "ai_summary": None
-        })
-        self._save_store()
+        }
+        self.store.add(entry)
         return report_id
 
     # -----------------------------
     # Offline parsing
     # -----------------------------
-    def _parse_report_values(self, text):
-        pattern = r"([A-Z][A-Z0-9\s]{1,30})[:\s]+([\d.]+)\s*(HIGH|LOW|NORMAL)?"
-        data = {}
-
-        for line in text.splitlines():
-            match = re.search(pattern, line.upper())
-            if match:
-                param, value, status = match.groups()
-                data[param.strip()] = {
-                    "value": value,
-                    "status": status.capitalize() if status else "Normal"
-                }
-        return data
+    @staticmethod
+    def _parse_report_values(text):
+        return {
+            m.group(1).upper(): {
+                "value": m.group(2),
+                "status": _STATUS_CODES[(m.group(3) or "NORMAL").upper()]
+            }
+            for m in _REPORT_VALUE_RE.finditer(text)
+        }
 
     def _offline_summary(self, parsed):
         if not parsed:
             return "⚠️ Unable to interpret report content."
 
-        high, low, normal = [], [], []
-
+        buckets = ([], [], [])
         for key, val in parsed.items():
-            if val["status"] == "High":
-                high.append(f"{key}: {val['value']} ↑")
-            elif val["status"] == "Low":
-                low.append(f"{key}: {val['value']} ↓")
-            else:
-                normal.append(f"{key}: {val['value']}")
+            status = val["status"]
+            buckets[status].append(f"- {key}: {val['value']}{_STATUS_ARROWS[status]}")
+        normal, high, low = buckets
 
         output = []
 
         if normal:
-            output.append("✔ Normal Values:")
-            output.extend(f"- {x}" for x in normal)
+            output.append("✔ Normal Values:\n" + "\n".join(normal))
 
         if high:
-            output.append("\n⚠ High Values:")
-            output.extend(f"- {x}" for x in high)
+            output.append("\n⚠ High Values:\n" + "\n".join(high))
 
         if low:
-            output.append("\n⚠ Low Values:")
-            output.extend(f"- {x}" for x in low)
+            output.append("\n⚠ Low Values:\n" + "\n".join(low))
 
         output.append("\n🚨 Recommendation:")
         output.append("- Please consult a qualified medical professional.")
@@ -112,7 +137,19 @@ class ReportQASystem:
     # Analyze report
     # -----------------------------
     def analyze_report(self, filename, content):
-        report_id = self.upload_report(filename, content)
+        content_hash = self._content_hash(content)
+        model_name = MODEL_NAME if self.model else OFFLINE_MODEL
+
+        cached = self.store.summaries.get((model_name, content_hash))
+        if cached:
+            return cached
+
+        # Same content uploaded before: keep its entry, only redo the summary
+        entry = self.store.content_index.get(content_hash)
+        if entry:
+            report_id = entry["id"]
+        else:
+            report_id = self.upload_report(filename, content, content_hash)
         summary = None
 
         if self.model:
@@ -144,31 +181,96 @@ Medical Report:
                     print(f"[Gemini failed] {e}")
 
         if not summary:
+            if entry and entry.get("ai_summary"):
+                return entry["ai_summary"]
+            model_name = OFFLINE_MODEL
             summary = self._offline_summary(
                 self._parse_report_values(content)
             )
 
-        for report in self.analysis_store["analyses"]:
-            if report["id"] == report_id:
-                report["ai_summary"] = summary
-
-        self._save_store()
+        self.store.set_summary(report_id, summary, model_name)
+        self.flush()
         return summary
 
     # -----------------------------
     # Answer questions
     # -----------------------------
+    def _response_key(self, question):
+        raw = question.strip().lower() + "|" + f"{self.store.corpus_hash:064x}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _cached_answer(self, key):
+        with self._response_lock:
+            hit = self._response_cache.get(key)
+            if hit is None:
+                return None
+            ts, answer = hit
+            if time.time() - ts >= self.RESPONSE_TTL:
+                del self._response_cache[key]
+                return None
+            self._response_cache.move_to_end(key)
+            return answer
+
+    def _remember_answer(self, key, answer):
+        with self._response_lock:
+            self._response_cache[key] = (time.time(), answer)
+            self._response_cache.move_to_end(key)
+            while len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+
+    def _combined_reports(self, reports):
+        if self._combined_cache[0] != self.store.version:
+            self._combined_cache = (
+                self.store.version,
+                "\n\n".join(report["analysis"] for report in reports)
+            )
+        return self._combined_cache[1]
+
+    def _relevant_reports(self, question, reports):
+        """Join the TOP_K_REPORTS reports most similar to the question."""
+        if len(reports) <= TOP_K_REPORTS:
+            return self._combined_reports(reports)
+
+        version, tfidf, doc_matrix, docs = self._tfidf_index
+        if version != self.store.version:
+            # Imported here so sklearn stays off the app's cold start
+            from sklearn.feature_extraction.text import TfidfVectorizer
+
+            version = self.store.version
+            docs = tuple(report["analysis"] for report in reports)
+            tfidf = TfidfVectorizer(stop_words="english")
+            try:
+                doc_matrix = tfidf.fit_transform(docs)
+            except ValueError:  # nothing but stop words / empty reports
+                doc_matrix = None
+            self._tfidf_index = (version, tfidf, doc_matrix, docs)
+
+        if doc_matrix is None:
+            return self._combined_reports(reports)
+
+        query_vec = tfidf.transform([question])
+        sims = (doc_matrix @ query_vec.T).toarray().ravel()
+        top = sims.argsort()[-TOP_K_REPORTS:][::-1]
+        return "\n\n".join(docs[i] for i in top)
+
     def answer_question(self, question):
+        """Yield the answer in chunks as Gemini streams it."""
         reports = self.analysis_store.get("analyses", [])
 
         if not reports:
-            return "⚠️ No reports uploaded."
+            yield "⚠️ No reports uploaded."
+            return
 
-        combined_reports = "\n\n".join(
-            report["analysis"] for report in reports
-        )
+        combined_reports = self._relevant_reports(question, reports)
 
         if self.model:
+            key = self._response_key(question)
+            cached = self._cached_answer(key)
+            if cached is not None:
+                yield cached
+                return
+
+            parts = []
             try:
                 response = self.model.generate_content(
                     f"""
@@ -184,15 +286,43 @@ Reports:
 
 Question:
 {question}
-"""
+""",
+                    stream=True
                 )
-                return response.text
+                for chunk in response:
+                    parts.append(chunk.text)
+                    yield chunk.text
+                self._remember_answer(key, "".join(parts))
+                return
 
             except Exception as e:
                 if "429" in str(e):
-                    return "⚠️ AI quota exceeded. Please try again later."
+                    yield "⚠️ AI quota exceeded. Please try again later."
+                    return
                 print(f"[Gemini failed] {e}")
+                if parts:
+                    yield "\n\n⚠️ Answer interrupted. Please try again."
+                    return
 
-        return self._offline_summary(
+        yield self._offline_summary(
             self._parse_report_values(combined_reports)
         )
+
+    def answer_question_sync(self, question):
+        """Return the full answer as one string."""
+        return "".join(self.answer_question(question))
+
+
+# -------------------------------------
+# Shared instance
+# -------------------------------------
+@st.cache_resource
+def get_qa_system(api_key=None):
+    """
+    Return the process-wide ReportQASystem for this key.
+
+    The instance is shared across reruns and sessions and is mutated in
+    place, so all writes go through it. Do not switch this to
+    st.cache_data, which would hand out copies.
+    """
+    return ReportQASystem(gemini_api_key=api_key)
@@ -0,0 +1,187 @@
+import json
+import os
+import mmap
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+STORE_PATH = "analysis_store.json"
+OFFLINE_MODEL = "offline"
+LOCK_PATH = STORE_PATH + ".lock"
+# Below this size a plain read is cheaper than setting up a mapping
+MMAP_MIN_BYTES = 16 * 1024
+
+
+# -----------------------------
+# Cross-process file lock
+# -----------------------------
+@contextmanager
+def _file_lock():
+    """Hold an exclusive lock on LOCK_PATH while reading or writing the store."""
+    with open(LOCK_PATH, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class AnalysisStore:
+    """
+    In-memory view of analysis_store.json shared by every Q&A system.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.data = self._load()
+        self._lock = threading.RLock()
+        self._dirty = False
+
+        # Bumped whenever the report list changes; keys derived caches
+        self.version = 0
+        # id -> the same entry dict held in data, for O(1) updates
+        self.id_index = {}
+        # sha256 of report text -> first entry with that content
+        self.content_index = {}
+        # Order-independent XOR of per-report digests, updated on insert
+        self.corpus_hash = 0
+        # (model, sha256 of report text) -> summary, so re-analyzing the
+        # same report is free across reruns and restarts
+        self.summaries = {}
+
+        for entry in self.data["analyses"]:
+            self._index(entry)
+
+    # -----------------------------
+    # Disk I/O
+    # -----------------------------
+    def _read_file(self):
+        """Parse the store file; the caller must hold _file_lock()."""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    if orjson and os.fstat(f.fileno()).st_size >= MMAP_MIN_BYTES:
+                        # Parse straight from the mapped pages, no bytes copy
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                            with memoryview(mm) as view:
+                                return orjson.loads(view)
+                    data = f.read()
+                return orjson.loads(data) if orjson else json.loads(data)
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError
+            except json.JSONDecodeError:
+                pass
+        return {"analyses": []}
+
+    def _load(self):
+        with _file_lock():
+            return self._read_file()
+
+    @staticmethod
+    def _entry_key(entry):
+        # Older entries have no id; fall back to what identifies an upload
+        return entry.get("id") or (
+            entry.get("filename"), entry.get("date"), entry.get("analysis")
+        )
+
+    def _merge(self, disk_data):
+        """Adopt entries another process wrote since this store was loaded."""
+        known = {self._entry_key(entry) for entry in self.data["analyses"]}
+        added = False
+        for entry in disk_data.get("analyses", []):
+            key = self._entry_key(entry)
+            if key not in known:
+                known.add(key)
+                self.data["analyses"].append(entry)
+                self._index(entry)
+                added = True
+        if added:
+            self.version += 1
+
+    def _save(self):
+        with _file_lock():
+            # Re-read under the lock so other processes' writes aren't lost
+            self._merge(self._read_file())
+            # Encode once and hand the bytes to a 64 KB buffered writer
+            if orjson:
+                data = orjson.dumps(self.data, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(self.data, indent=2, ensure_ascii=False).encode("utf-8")
+            with open(self.path, "wb", buffering=65536) as f:
+                f.write(data)
+
+    def flush(self):
+        """Persist pending changes; a no-op when nothing has changed."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+                self._dirty = False
+
+    # -----------------------------
+    # Mutation
+    # -----------------------------
+    def _index(self, entry):
+        if "id" in entry:
+            self.id_index[entry["id"]] = entry
+            if entry.get("content_hash"):
+                self.content_index.setdefault(entry["content_hash"], entry)
+        digest = hashlib.sha256(
+            (entry.get("id", "") + "|" + entry["analysis"]).encode()
+        ).digest()
+        self.corpus_hash ^= int.from_bytes(digest, "big")
+        if entry.get("content_hash") and entry.get("ai_summary"):
+            key = (entry.get("summary_model", OFFLINE_MODEL), entry["content_hash"])
+            self.summaries[key] = entry["ai_summary"]
+
+    def add(self, entry):
+        """Append a report entry; call flush() to write it out."""
+        with self._lock:
+            self.data["analyses"].append(entry)
+            self._index(entry)
+            self.version += 1
+            self._dirty = True
+
+    def set_summary(self, report_id, summary, model_name):
+        """Attach a generated summary to a stored report."""
+        with self._lock:
+            entry = self.id_index[report_id]
+            entry["ai_summary"] = summary
+            entry["summary_model"] = model_name
+            if entry.get("content_hash"):
+                self.summaries[(model_name, entry["content_hash"])] = summary
+            self._dirty = True
+
+
+# -----------------------------
+# Process-wide singleton
+# -----------------------------
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the shared AnalysisStore, loading it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AnalysisStore()
+    return _store
@@ -1,6 +1,9 @@
+import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-API_KEY = "adf6140c89msh16c85cb38a4c91ep1c941fjsn6ed1199558e3"
+API_KEY = os.environ["RAPIDAPI_KEY"]
 API_HOST = "ai-doctor-api-ai-medical-chatbot-healthcare-ai-assistant.p.rapidapi.com"
 BASE_URL = f"https://{API_HOST}/chat?noqueue=1"
 
@@ -16,6 +19,15 @@ headers = {
     "X-RapidAPI-Host": API_HOST
 }
 
-response = requests.post(BASE_URL, json=payload, headers=headers)
+# Pooled session so repeated calls reuse the TCP+TLS connection
+_SESSION = requests.Session()
+_SESSION.headers.update(headers)
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.2)
+))
+
+response = _SESSION.post(BASE_URL, json=payload, timeout=10)
 print(response.status_code)
 print(response.json())
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("streamlit")
+
+from report_qa_chat import (
+    STATUS_HIGH,
+    STATUS_LOW,
+    STATUS_NORMAL,
+    ReportQASystem,
+)
+
+parse = ReportQASystem._parse_report_values
+
+
+@pytest.mark.parametrize("line, name, value, status", [
+    ("WBC: 13.39 HIGH", "WBC", "13.39", STATUS_HIGH),
+    ("Hemoglobin - 10.2 LOW", "HEMOGLOBIN", "10.2", STATUS_LOW),
+    ("Glucose:110 normal", "GLUCOSE", "110", STATUS_NORMAL),
+    ("HGB 12.0", "HGB", "12.0", STATUS_NORMAL),
+    ("WBC 11000 HIGH", "WBC", "11000", STATUS_HIGH),
+    ("Platelets 250000", "PLATELETS", "250000", STATUS_NORMAL),
+    ("Vitamin B12 180 LOW", "VITAMIN B12", "180", STATUS_LOW),
+    # DOCX table rows arrive as cells joined with a single space
+    ("Hemoglobin 13.5 g/dL 12.0 - 17.0", "HEMOGLOBIN", "13.5", STATUS_NORMAL),
+    ("Platelets 250000 150000-450000", "PLATELETS", "250000", STATUS_NORMAL),
+    ("  RBC Count\t4.8", "RBC COUNT", "4.8", STATUS_NORMAL),
+    # Bulleted and numbered lists
+    ("- Glucose: 110 HIGH", "GLUCOSE", "110", STATUS_HIGH),
+    ("1. Sodium: 140", "SODIUM", "140", STATUS_NORMAL),
+    ("2) Potassium 3.1 LOW", "POTASSIUM", "3.1", STATUS_LOW),
+    ("• HGB 12.0", "HGB", "12.0", STATUS_NORMAL),
+    ("  * WBC 11000 HIGH", "WBC", "11000", STATUS_HIGH),
+])
+def test_parses_lab_value_lines(line, name, value, status):
+    assert parse(line) == {name: {"value": value, "status": status}}
+
+
+@pytest.mark.parametrize("line", [
+    "Patient Name John Doe",
+    "Remarks: see attached",
+    "12.5 mg/dL",
+    "",
+])
+def test_ignores_lines_without_values(line):
+    assert parse(line) == {}
+
+
+def test_parses_every_line_of_a_report():
+    report = "CBC\nHGB 12.0\nWBC: 11000 HIGH\n\nPlatelets 90000 LOW\n"
+    assert parse(report) == {
+        "HGB": {"value": "12.0", "status": STATUS_NORMAL},
+        "WBC": {"value": "11000", "status": STATUS_HIGH},
+        "PLATELETS": {"value": "90000", "status": STATUS_LOW},
+    }